@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Allow direct execution
+import os
+import sys
+import unittest
+import unittest.mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+import http.client
+import io
+import json
+import shutil
+import struct
+import tempfile
+import urllib.error
+
+from yt_dlp.update import _parse_sha256sums, run_update
+
+VERSION_INFO = {'tag_name': '2000.01.01', 'assets': []}
+
+
+class FakeCache:
+    def __init__(self, data=None):
+        self.data = data
+        self.stored = []
+
+    def load(self, section, key):
+        return self.data
+
+    def store(self, section, key, data):
+        self.stored.append(data)
+
+
+class FakeOpener:
+    def __init__(self, status=200, version_info=VERSION_INFO, files={}):
+        self.status = status
+        self.version_info = version_info
+        self.files = files
+        self.requests = []
+
+    def open(self, req):
+        self.requests.append(req)
+        if req in self.files:
+            return self.files[req]()
+        if self.status == 304:
+            raise urllib.error.HTTPError(req.full_url, 304, 'Not Modified', {}, None)
+        urlh = io.BytesIO(json.dumps(self.version_info).encode())
+        urlh.headers = {'ETag': '"abc"', 'Last-Modified': 'Sat, 01 Jan 2000 00:00:00 GMT'}
+        return urlh
+
+
+class FakeUpdateYDL:
+    params = {}
+
+    def __init__(self, opener, cache):
+        self._opener = opener
+        self.cache = cache
+        self.messages = []
+
+    def to_screen(self, msg):
+        self.messages.append(msg)
+
+    def report_warning(self, msg):
+        self.messages.append(f'WARNING: {msg}')
+
+    def report_error(self, msg, tb=None):
+        self.messages.append(f'ERROR: {msg}')
+
+
+@unittest.mock.patch('yt_dlp.update.is_non_updateable', lambda: None)
+class TestUpdate(unittest.TestCase):
+    def test_version_info_fetch(self):
+        ydl = FakeUpdateYDL(FakeOpener(), FakeCache())
+        run_update(ydl)
+        self.assertIn('Latest version: 2000.01.01', ydl.messages[0])
+        self.assertEqual(ydl.cache.stored, [{
+            'etag': '"abc"',
+            'last_modified': 'Sat, 01 Jan 2000 00:00:00 GMT',
+            'version_info': VERSION_INFO,
+        }])
+
+    def test_version_info_not_modified(self):
+        ydl = FakeUpdateYDL(FakeOpener(304), FakeCache({'etag': '"abc"', 'version_info': VERSION_INFO}))
+        run_update(ydl)
+        self.assertEqual(ydl._opener.requests[0].get_header('If-none-match'), '"abc"')
+        self.assertIn('Latest version: 2000.01.01', ydl.messages[0])
+        self.assertEqual(ydl.cache.stored, [])
+
+    def test_version_info_not_modified_without_cache(self):
+        for cached in (None, {'etag': '"abc"'}):
+            ydl = FakeUpdateYDL(FakeOpener(304), FakeCache(cached))
+            run_update(ydl)
+            self.assertEqual(ydl._opener.requests[0].get_header('If-none-match'), None)
+            self.assertIn('Unable to obtain version info', ydl.messages[0])
+            self.assertEqual(ydl.cache.stored, [])
+
+    def test_parse_sha256sums(self):
+        self.assertEqual(_parse_sha256sums(
+            'aaaa  yt-dlp.exe \n'
+            '\n'
+            '   \n'
+            'deadbeef\n'
+            'bbbb  yt-dlp\r\n'), {'yt-dlp.exe': 'aaaa', 'yt-dlp': 'bbbb'})
+
+    def test_unparsable_versions(self):
+        with unittest.mock.patch('yt_dlp.update.__version__', '2022.05.18-patched'):
+            ydl = FakeUpdateYDL(FakeOpener(), FakeCache())
+            run_update(ydl)
+        self.assertEqual(ydl._opener.requests, [])
+        self.assertIn('Unable to parse the current version', ydl.messages[0])
+
+        ydl = FakeUpdateYDL(FakeOpener(version_info={'tag_name': 'nightly', 'assets': []}), FakeCache())
+        run_update(ydl)
+        self.assertIn("Unable to parse the latest version 'nightly'", ydl.messages[-1])
+
+
+class IncompleteResponse(io.BytesIO):
+    def read(self, size=-1):
+        raise http.client.IncompleteRead(b'')
+
+
+@unittest.mock.patch('yt_dlp.update.is_non_updateable', lambda: None)
+@unittest.mock.patch('yt_dlp.update.detect_variant', lambda: 'win_exe')
+class TestUpdateExe(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.test_dir, 'yt-dlp.exe')
+        with open(self.filename, 'wb') as f:
+            f.write(b'old')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def run_update(self, response):
+        version_info = {'tag_name': '9999.01.01', 'assets': [
+            {'name': f'yt-dlp{".exe" if struct.calcsize("P") == 8 else "_x86.exe"}', 'browser_download_url': 'bin'},
+        ]}
+        ydl = FakeUpdateYDL(FakeOpener(version_info=version_info, files={'bin': response}), FakeCache())
+        with unittest.mock.patch.object(sys, 'frozen', True, create=True), \
+                unittest.mock.patch.object(sys, 'executable', self.filename):
+            self.assertFalse(run_update(ydl))
+        return ydl.messages
+
+    def test_incomplete_download(self):
+        messages = self.run_update(lambda: IncompleteResponse(b'new'))
+        self.assertIn('Unable to download latest version', messages[-1])
+        self.assertEqual(os.listdir(self.test_dir), ['yt-dlp.exe'])
+
+    def test_write_error(self):
+        with unittest.mock.patch('os.fsync', side_effect=OSError('No space left on device')):
+            messages = self.run_update(lambda: io.BytesIO(b'new'))
+        self.assertIn(f'Unable to write to {self.filename}.new', messages[-1])
+        self.assertEqual(os.listdir(self.test_dir), ['yt-dlp.exe'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,7 +25,7 @@
     MetadataFromFieldPP,
     MetadataParserPP,
 )
-from .update import run_update
+from .update import remove_old_version, run_update
 from .utils import (
     NO_DEFAULT,
     POSTPROCESS_WHEN,
@@ -834,6 +834,7 @@ def parse_options(argv=None):
 
 def _real_main(argv=None):
     setproctitle('yt-dlp')
+    remove_old_version()
 
     parser, opts, all_urls, ydl_opts = parse_options(argv)
 
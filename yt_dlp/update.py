@@ -1,17 +1,24 @@
+import concurrent.futures
+import contextlib
 import hashlib
+import http.client
+import io
 import json
 import os
-import platform
-import subprocess
+import shutil
+import struct
 import sys
 import traceback
+import urllib.error
 from zipimport import zipimporter
 
 from .compat import compat_realpath, functools
-from .utils import Popen, encode_compat_str, write_string
+from .utils import encode_compat_str, sanitized_Request, write_string
 from .version import __version__
 
 
+# Not evaluated at import time since sys.argv[0] is still '-m'
+# while the package is being imported by `python -m yt_dlp`
 @functools.cache
 def detect_variant():
     if hasattr(sys, 'frozen'):
@@ -40,10 +47,48 @@ def detect_variant():
 }
 
 
+@functools.cache
 def is_non_updateable():
     return _NON_UPDATEABLE_REASONS.get(detect_variant(), _NON_UPDATEABLE_REASONS['unknown'])
 
 
+def remove_old_version():
+    """Remove the executable left behind by a previous update"""
+    if detect_variant() not in ('win_exe', 'py2exe'):
+        return
+    with contextlib.suppress(OSError):
+        os.remove(compat_realpath(sys.executable) + '.old')
+
+
+def _parse_sha256sums(hash_data):
+    hashes = {}
+    for line in hash_data.splitlines():
+        h, _, name = line.strip().partition(' ')
+        name = name.strip()
+        if name:
+            hashes[name] = h
+    return hashes
+
+
+class _DownloadError(Exception):
+    """Raised when the release could not be downloaded, as opposed to written"""
+
+
+class _HashingReader:
+    """Wraps a response, feeding everything read from it into a hash"""
+
+    def __init__(self, fp, digest):
+        self._fp, self._digest = fp, digest
+
+    def read(self, size=-1):
+        try:
+            data = self._fp.read(size)
+        except (OSError, http.client.HTTPException) as err:
+            raise _DownloadError(err) from err
+        self._digest.update(data)
+        return data
+
+
 def run_update(ydl):
     """
     Update the program file with the latest version from the repository
@@ -51,8 +96,20 @@ def run_update(ydl):
     """
 
     JSON_URL = 'https://api.github.com/repos/yt-dlp/yt-dlp/releases/latest'
+    current_hash = None
+
+    def report_current_hash():
+        nonlocal current_hash
+        if not current_hash:
+            return
+        try:
+            ydl.to_screen(f'Current Build Hash {current_hash.result()}')
+        except OSError as err:
+            ydl.report_warning(f'Unable to calculate the current build hash: {err}')
+        current_hash = None
 
     def report_error(msg, expected=False):
+        report_current_hash()
         ydl.report_error(msg, tb='' if expected else None)
 
     def report_unable(action, expected=False):
@@ -66,38 +123,77 @@ def report_network_error(action, delim=';'):
 
     def calc_sha256sum(path):
         h = hashlib.sha256()
-        b = bytearray(128 * 1024)
-        mv = memoryview(b)
-        with open(os.path.realpath(path), 'rb', buffering=0) as f:
+        mv = memoryview(bytearray(1024 * 1024))
+        with open(path, 'rb', buffering=0) as f:
             for n in iter(lambda: f.readinto(mv), 0):
                 h.update(mv[:n])
         return h.hexdigest()
 
+    def get_version_info():
+        # The deprecated update_self passes an object without a cache
+        cache = getattr(ydl, 'cache', None)
+        cached = (cache.load('update', 'version_info') if cache else None) or {}
+        if not cached.get('version_info'):
+            cached = {}
+
+        headers = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        try:
+            urlh = ydl._opener.open(sanitized_Request(JSON_URL, headers=headers))
+        except urllib.error.HTTPError as err:
+            if err.code != 304 or not cached:
+                raise
+            return cached['version_info']
+
+        version_info = json.loads(urlh.read().decode())
+        if cache:
+            cache.store('update', 'version_info', {
+                'etag': urlh.headers.get('ETag'),
+                'last_modified': urlh.headers.get('Last-Modified'),
+                'version_info': version_info,
+            })
+        return version_info
+
+    def version_tuple(version_str):
+        return tuple(map(int, version_str.split('.')))
+
+    err = is_non_updateable()
+    if err:
+        return report_error(err, True)
+
+    try:
+        current_version = version_tuple(__version__)
+    except ValueError:
+        return report_unable(f'parse the current version {__version__!r}', True)
+
     # Download and check versions info
     try:
-        version_info = ydl._opener.open(JSON_URL).read().decode()
-        version_info = json.loads(version_info)
+        version_info = get_version_info()
     except Exception:
         return report_network_error('obtain version info', delim='; Please try again later or')
 
-    def version_tuple(version_str):
-        return tuple(map(int, version_str.split('.')))
-
     version_id = version_info['tag_name']
     ydl.to_screen(f'Latest version: {version_id}, Current version: {__version__}')
-    if version_tuple(__version__) >= version_tuple(version_id):
+    try:
+        latest_version = version_tuple(version_id)
+    except ValueError:
+        return report_network_error(f'parse the latest version {version_id!r}')
+    if current_version >= latest_version:
         ydl.to_screen(f'yt-dlp is up to date ({__version__})')
         return
 
-    err = is_non_updateable()
-    if err:
-        return report_error(err, True)
-
     # sys.executable is set to the full pathname of the exe-file for py2exe
     # though symlinks are not followed so that we need to do this manually
     # with help of realpath
     filename = compat_realpath(sys.executable if hasattr(sys, 'frozen') else sys.argv[0])
-    ydl.to_screen(f'Current Build Hash {calc_sha256sum(filename)}')
+    if ydl.params.get('verbose'):
+        # Hash the current build while the new one is being downloaded
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        current_hash = executor.submit(calc_sha256sum, filename)
+        executor.shutdown(wait=False)
     ydl.to_screen(f'Updating to version {version_id} ...')
 
     version_labels = {
@@ -108,19 +204,39 @@ def version_tuple(version_str):
         'mac_exe_64': '_macos',
     }
 
-    def get_bin_info(bin_or_exe, version):
-        label = version_labels[f'{bin_or_exe}_{version}']
-        return next((i for i in version_info['assets'] if i['name'] == 'yt-dlp%s' % label), {})
+    assets = {asset['name']: asset for asset in version_info['assets']}
 
-    def get_sha256sum(bin_or_exe, version):
-        filename = 'yt-dlp%s' % version_labels[f'{bin_or_exe}_{version}']
-        urlh = next(
-            (i for i in version_info['assets'] if i['name'] in ('SHA2-256SUMS')),
-            {}).get('browser_download_url')
+    def get_bin_name(bin_or_exe, version):
+        return f'yt-dlp{version_labels[f"{bin_or_exe}_{version}"]}'
+
+    def get_bin_url(bin_or_exe, version):
+        return assets.get(get_bin_name(bin_or_exe, version), {}).get('browser_download_url')
+
+    def get_hashes():
+        urlh = assets.get('SHA2-256SUMS', {}).get('browser_download_url')
         if not urlh:
-            return None
+            return {}
         hash_data = ydl._opener.open(urlh).read().decode()
-        return dict(ln.split()[::-1] for ln in hash_data.splitlines()).get(filename)
+        return _parse_sha256sums(hash_data)
+
+    def get_sha256sum(bin_or_exe, version):
+        return get_hashes().get(get_bin_name(bin_or_exe, version))
+
+    def download_and_hash(url, outf):
+        h = hashlib.sha256()
+        try:
+            urlh = ydl._opener.open(url)
+        except OSError as err:
+            raise _DownloadError(err) from err
+        with urlh:
+            shutil.copyfileobj(_HashingReader(urlh, h), outf, length=1024 * 1024)
+        return h.hexdigest()
+
+    def remove_new():
+        try:
+            os.remove(filename + '.new')
+        except OSError:
+            report_unable('remove corrupt download')
 
     if not os.access(filename, os.W_OK):
         return report_permission_error(filename)
@@ -137,74 +253,72 @@ def get_sha256sum(bin_or_exe, version):
         except OSError:
             return report_unable('remove the old version')
 
+        arch = str(struct.calcsize('P') * 8)
+        url = get_bin_url(variant, arch)
+        if not url:
+            return report_network_error('fetch updates')
         try:
-            arch = platform.architecture()[0][:2]
-            url = get_bin_info(variant, arch).get('browser_download_url')
-            if not url:
-                return report_network_error('fetch updates')
-            urlh = ydl._opener.open(url)
-            newcontent = urlh.read()
-            urlh.close()
-        except OSError:
-            return report_network_error('download latest version')
-
-        try:
-            with open(filename + '.new', 'wb') as outf:
-                outf.write(newcontent)
+            outf = open(filename + '.new', 'wb', buffering=1024 * 1024)
         except OSError:
             return report_permission_error(f'{filename}.new')
+        try:
+            with outf:
+                actual_sum = download_and_hash(url, outf)
+                # Make sure what was hashed is on disk before it replaces the current version
+                outf.flush()
+                os.fsync(outf.fileno())
+        except BaseException as err:
+            remove_new()
+            if isinstance(err, _DownloadError):
+                return report_network_error('download latest version')
+            elif isinstance(err, OSError):
+                return report_permission_error(f'{filename}.new')
+            raise
+        report_current_hash()
 
         expected_sum = get_sha256sum(variant, arch)
         if not expected_sum:
             ydl.report_warning('no hash information found for the release')
-        elif calc_sha256sum(filename + '.new') != expected_sum:
+        elif actual_sum != expected_sum:
             report_network_error('verify the new executable')
-            try:
-                os.remove(filename + '.new')
-            except OSError:
-                return report_unable('remove corrupt download')
+            return remove_new()
 
         try:
-            os.rename(filename, filename + '.old')
+            os.replace(filename, filename + '.old')
         except OSError:
             return report_unable('move current version')
         try:
-            os.rename(filename + '.new', filename)
+            os.replace(filename + '.new', filename)
         except OSError:
             report_unable('overwrite current version')
-            os.rename(filename + '.old', filename)
+            os.replace(filename + '.old', filename)
             return
-        try:
-            # Continues to run in the background
-            Popen(
-                'ping 127.0.0.1 -n 5 -w 1000 & del /F "%s.old"' % filename,
-                shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            ydl.to_screen('Updated yt-dlp to version %s' % version_id)
-            return True  # Exit app
-        except OSError:
-            report_unable('delete the old version')
+        # The running executable cannot be deleted on windows;
+        # The old version is removed on the next run instead
+        ydl.to_screen('Updated yt-dlp to version %s' % version_id)
+        return True  # Exit app
 
     elif variant in ('zip', 'mac_exe'):
         pack_type = '3' if variant == 'zip' else '64'
+        url = get_bin_url(variant, pack_type)
+        if not url:
+            return report_network_error('fetch updates')
+        newcontent = io.BytesIO()
         try:
-            url = get_bin_info(variant, pack_type).get('browser_download_url')
-            if not url:
-                return report_network_error('fetch updates')
-            urlh = ydl._opener.open(url)
-            newcontent = urlh.read()
-            urlh.close()
-        except OSError:
+            actual_sum = download_and_hash(url, newcontent)
+        except _DownloadError:
             return report_network_error('download the latest version')
+        report_current_hash()
 
         expected_sum = get_sha256sum(variant, pack_type)
         if not expected_sum:
             ydl.report_warning('no hash information found for the release')
-        elif hashlib.sha256(newcontent).hexdigest() != expected_sum:
+        elif actual_sum != expected_sum:
             return report_network_error('verify the new package')
 
         try:
             with open(filename, 'wb') as outf:
-                outf.write(newcontent)
+                outf.write(newcontent.getbuffer())
         except OSError:
             return report_unable('overwrite current version')
 
@@ -226,6 +340,7 @@ def update_self(to_screen, verbose, opener):
     class FakeYDL():
         _opener = opener
         to_screen = printfn
+        params = {'verbose': verbose}
 
         @staticmethod
         def report_warning(msg, *args, **kwargs):